@@ -0,0 +1,668 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Moltbot Wrapper benchmarks.
+Times the wrapper's own overhead against stub node/pnpm/npm executables and a
+local HTTP server serving a fake Node.js archive. Runs offline on plain Linux.
+
+    python bench_wrapper.py [--iterations 20] [--cold-iterations 5]
+                            [--output bench_results.json]
+                            [--compare old.json] [--threshold 10]
+    python bench_wrapper.py --mirrors | --concurrent | --workers
+
+Scenario modes run one check instead of the benchmarks and exit 1 on failure:
+--mirrors times a cold launch against three throttled local mirrors, the
+fastest of which stalls after 1 MB, and checks the download fails over.
+--concurrent cold-launches one checkout from several processes at once and
+checks the setup phases ran once; then kills a wrapper holding the install
+lock and checks the next launch breaks the stale lock.
+--workers puts three echo servers behind the `gateway --workers` load
+balancer, checks round-robin, then kills one and checks it leaves the
+rotation and is restarted.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.server
+import importlib.util
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+WRAPPER = Path(__file__).parent.resolve() / "moltbot_wrapper.py"
+
+# ============================================================================
+# Stub toolchain (Python scripts, so no system tools are needed on PATH)
+# ============================================================================
+
+NODE_STUB = '''#!{python}
+import pathlib, sys
+args = sys.argv[1:]
+if args[:1] == ["--version"]:
+    print("v{node_version}")
+    sys.exit(0)
+outputs = {{
+    "scripts/canvas-a2ui-copy.ts": "dist/canvas-host/a2ui/index.html",
+    "scripts/copy-hook-metadata.ts": "dist/hooks/metadata.json",
+    "scripts/write-build-info.ts": "dist/build-info.json",
+}}
+if args[:2] == ["--import", "tsx"] and len(args) > 2 and args[2] in outputs:
+    out = pathlib.Path(outputs[args[2]])
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text("{{}}")
+'''
+
+PNPM_STUB = '''#!{python}
+import os, pathlib, sys, time
+args = sys.argv[1:]
+if args[:1] == ["--version"]:
+    print("9.15.0")
+elif args[:1] == ["install"]:
+    time.sleep(float(os.environ.get("BENCH_INSTALL_DELAY", "0")))
+    pathlib.Path("node_modules/.pnpm").mkdir(parents=True, exist_ok=True)
+    with open(".bench-installs", "a") as f:
+        f.write(f"{{os.getpid()}}\\n")
+elif args[:2] == ["exec", "tsc"]:
+    pathlib.Path("dist").mkdir(exist_ok=True)
+    pathlib.Path("dist/index.js").write_text("")
+elif args[:1] == ["ui:build"]:
+    pathlib.Path("dist/control-ui").mkdir(parents=True, exist_ok=True)
+elif args[:1] == ["moltbot"]:
+    print("moltbot", *args[1:])
+'''
+
+NPM_STUB = '''#!{python}
+import json, os, pathlib, shutil, sys
+here = pathlib.Path(__file__).resolve().parent
+args = sys.argv[1:]
+if args[:2] == ["install", "-g"] and args[-1] == "pnpm":
+    # Same layout as npm: package under lib/node_modules, bin/ symlink into it
+    prefix = pathlib.Path(args[args.index("--prefix") + 1]) if "--prefix" in args else here.parent
+    package = prefix / "lib" / "node_modules" / "pnpm"
+    (package / "bin").mkdir(parents=True, exist_ok=True)
+    (package / "package.json").write_text(json.dumps({{"name": "pnpm", "bin": {{"pnpm": "bin/pnpm.cjs"}}}}))
+    shutil.copy(here.parent / "lib" / "pnpm-stub", package / "bin" / "pnpm.cjs")
+    os.chmod(package / "bin" / "pnpm.cjs", 0o755)
+    (prefix / "bin").mkdir(exist_ok=True)
+    link = prefix / "bin" / "pnpm"
+    if not os.path.lexists(link):
+        link.symlink_to("../lib/node_modules/pnpm/bin/pnpm.cjs")
+'''
+
+BUNDLE_STUB = '''import pathlib
+out = pathlib.Path(__file__).resolve().parent.parent / "src/canvas-host/a2ui/a2ui.bundle.js"
+out.parent.mkdir(parents=True, exist_ok=True)
+out.write_text("// bundle")
+'''
+
+ECHO_WORKER = '''import os, socketserver, sys
+index, port = sys.argv[1], int(sys.argv[2])
+class Echo(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            self.wfile.write(f"worker {{index}} pid {{os.getpid()}}: ".encode() + line)
+socketserver.ThreadingTCPServer.allow_reuse_address = True
+with socketserver.ThreadingTCPServer(("127.0.0.1", port), Echo) as server:
+    server.serve_forever()
+'''
+
+BALANCER_DRIVER = '''import sys
+import moltbot_wrapper as wrapper
+ports = {ports!r}
+workers = [wrapper.GatewayWorker(i + 1, port, [sys.executable, "echo_worker.py", str(i + 1), str(port)])
+           for i, port in enumerate(ports)]
+sys.exit(0 if wrapper.run_balanced_workers(workers, "127.0.0.1", {proxy}, "round-robin") else 1)
+'''
+
+def write_script(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+    path.chmod(0o755)
+
+def build_node_archive(dist_dir: Path, dist_name: str, version: str, ext: str,
+                       padding: int = 0):
+    """Write a fake node-v*/ archive plus SHASUMS256.txt under dist_dir/v<version>/.
+
+    padding adds that many random (incompressible) bytes to the archive.
+    """
+    release = dist_dir / f"v{version}"
+    release.mkdir(parents=True)
+    fmt = {"python": sys.executable, "node_version": version}
+    files = {
+        f"{dist_name}/bin/node": NODE_STUB.format(**fmt),
+        f"{dist_name}/bin/npm": NPM_STUB.format(**fmt),
+        f"{dist_name}/lib/pnpm-stub": PNPM_STUB.format(**fmt),
+    }
+    if padding:
+        files[f"{dist_name}/lib/padding.bin"] = os.urandom(padding)
+    archive = release / f"{dist_name}.{ext}"
+    mode = {"tar.xz": "w:xz", "tar.gz": "w:gz"}[ext]
+    with tarfile.open(archive, mode) as tar:
+        for name, content in files.items():
+            data = content if isinstance(content, bytes) else content.encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o755
+            tar.addfile(info, io.BytesIO(data))
+    digest = hashlib.sha256(archive.read_bytes()).hexdigest()
+    (release / "SHASUMS256.txt").write_text(f"{digest}  {archive.name}\n")
+
+def build_project_template(root: Path, source_files: int):
+    """A fake moltbot checkout with the wrapper copied in."""
+    root.mkdir(parents=True)
+    shutil.copy(WRAPPER, root / "moltbot_wrapper.py")
+    (root / "package.json").write_text('{"name": "moltbot"}')
+    (root / "pnpm-lock.yaml").write_text("lockfileVersion: '9.0'\n")
+    (root / "tsconfig.json").write_text("{}")
+    for i in range(source_files):
+        sub = root / "src" / f"mod{i % 20}"
+        sub.mkdir(parents=True, exist_ok=True)
+        (sub / f"file{i}.ts").write_text(f"export const value{i} = {i};\n" * 20)
+    (root / "src" / "hooks").mkdir(parents=True, exist_ok=True)
+    (root / "src" / "hooks" / "README.md").write_text("hooks")
+    for script in ("canvas-a2ui-copy.ts", "copy-hook-metadata.ts", "write-build-info.ts"):
+        write_script(root / "scripts" / script, "// stub\n")
+    write_script(root / "scripts" / "bundle-a2ui.py", BUNDLE_STUB)
+    (root / "ui").mkdir()
+    (root / "ui" / "package.json").write_text("{}")
+
+# ============================================================================
+# Harness
+# ============================================================================
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class ThrottledHandler(QuietHandler):
+    """Serves files (with single Range support) at rate bytes/s.
+
+    After stall_after bytes in total the server stops sending without
+    closing the connection, until released is set.
+    """
+    rate = 1 << 20
+    stall_after = None
+    sent = 0
+    lock = threading.Lock()
+    released = threading.Event()
+    CHUNK = 16 * 1024
+
+    def do_GET(self):
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return
+        data = path.read_bytes()
+        start, end = 0, len(data)
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1, len(data)) if match.group(2) else len(data)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        while start < end:
+            chunk = data[start:min(start + self.CHUNK, end)]
+            with self.lock:
+                stalled = self.stall_after is not None and type(self).sent >= self.stall_after
+                type(self).sent += 0 if stalled else len(chunk)
+            if stalled:
+                self.released.wait()
+                return
+            try:
+                self.wfile.write(chunk)
+            except OSError:
+                return
+            start += len(chunk)
+            time.sleep(len(chunk) / self.rate)
+
+def throttled_handler(rate: int, stall_after=None) -> type:
+    """A ThrottledHandler subclass with its own rate and byte counter."""
+    return type("Throttled", (ThrottledHandler,), {
+        "rate": rate, "stall_after": stall_after, "sent": 0,
+        "lock": threading.Lock(), "released": threading.Event()})
+
+def start_server(directory: Path, handler_class: type = QuietHandler) -> http.server.ThreadingHTTPServer:
+    handler = lambda *a, **kw: handler_class(*a, directory=str(directory), **kw)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+@contextlib.contextmanager
+def silence_fds():
+    """Point fds 1 and 2 at /dev/null, so children started in-process stay quiet too."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, copy in zip((1, 2), saved):
+            os.dup2(copy, fd)
+            os.close(copy)
+        os.close(devnull)
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    pos = (len(ordered) - 1) * pct / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "n": len(samples),
+        "min": min(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "max": max(samples),
+        "mean": sum(samples) / len(samples),
+        "samples": samples,
+    }
+
+def time_it(func: Callable[[], None], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+class Bench:
+    def __init__(self, work: Path, source_files: int, handler_class: type = QuietHandler):
+        self.work = work
+        self.bin_dir = work / "bin"
+        self.bin_dir.mkdir()
+        (self.bin_dir / "python").symlink_to(sys.executable)
+        (self.bin_dir / "python3").symlink_to(sys.executable)
+
+        # Read the platform/dist name the wrapper will ask for
+        wrapper = self.load_wrapper(WRAPPER)
+        self.dist = work / "dist-server"
+        build_node_archive(self.dist, wrapper.NODE_DIST_NAME, wrapper.NODE_VERSION,
+                           wrapper.NODE_ARCHIVE_EXT)
+        self.server = start_server(self.dist, handler_class)
+
+        self.template = work / "template"
+        build_project_template(self.template, source_files)
+        self.runs = 0
+
+        # Only the stub python is on PATH, so the host's node/pnpm stay invisible
+        self.env = {
+            "PATH": str(self.bin_dir),
+            "HOME": str(work / "home"),
+            "MOLTBOT_CACHE_DIR": "",
+            "MOLTBOT_NODE_DIST_URL": f"http://127.0.0.1:{self.server.server_port}",
+            "PYTHONIOENCODING": "utf-8",
+        }
+
+    @staticmethod
+    def load_wrapper(path: Path):
+        spec = importlib.util.spec_from_file_location(f"bench_{abs(hash(path))}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def fresh_checkout(self) -> Path:
+        self.runs += 1
+        root = self.work / f"run{self.runs}"
+        shutil.copytree(self.template, root, symlinks=True)
+        return root
+
+    def launch(self, root: Path, *args: str):
+        result = subprocess.run(
+            [sys.executable, str(root / "moltbot_wrapper.py"), *args],
+            cwd=root, env=self.env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace"
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"wrapper exited with {result.returncode}:\n{result.stdout[-2000:]}")
+        return result.stdout
+
+    @contextlib.contextmanager
+    def in_process(self, root: Path):
+        """Import the checkout's wrapper with the bench environment applied."""
+        saved = os.environ.copy()
+        saved_cwd = os.getcwd()
+        os.environ.update(self.env)
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+                    contextlib.redirect_stderr(devnull), silence_fds():
+                module = self.load_wrapper(root / "moltbot_wrapper.py")
+                module.add_node_to_path()
+                os.chdir(root)
+                yield module
+        finally:
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved)
+
+    def run(self, iterations: int, cold_iterations: int) -> Dict[str, dict]:
+        results = {}
+
+        # Cold: fresh checkout, portable Node.js download, pnpm, install, build, launch
+        samples = []
+        for _ in range(cold_iterations):
+            root = self.fresh_checkout()
+            samples += time_it(lambda: self.launch(root, "doctor"), 1)
+        results["cold_setup_launch"] = summarize(samples)
+
+        # Warm: the same checkout launched again (cached setup state)
+        results["warm_launch"] = summarize(time_it(lambda: self.launch(root, "doctor"), iterations))
+
+        with self.in_process(root) as wrapper:
+            results["warm_full_setup"] = summarize(time_it(wrapper.full_setup, iterations))
+            results["build_project_noop"] = summarize(time_it(wrapper.build_project, iterations))
+            results["build_project_forced"] = summarize(
+                time_it(lambda: wrapper.build_project(force=True), max(1, iterations // 4)))
+
+            # Menu dispatch: option 4 (doctor) through handle_menu, Enter auto-answered
+            wrapper.input = lambda *args: ""
+            results["menu_run_moltbot"] = summarize(
+                time_it(lambda: wrapper.handle_menu("4"), iterations))
+        return results
+
+    def close(self):
+        self.server.shutdown()
+
+def run_mirror_failover(work: Path) -> int:
+    """Cold launch against a stalling fast mirror, a fast one and a slow one."""
+    wrapper = Bench.load_wrapper(WRAPPER)
+    dist = work / "mirror-dist"
+    build_node_archive(dist, wrapper.NODE_DIST_NAME, wrapper.NODE_VERSION,
+                       wrapper.NODE_ARCHIVE_EXT, padding=4 << 20)
+    # The stalling mirror wins the 256 KB probe, then stops after 1 MB
+    handlers = {
+        "stalling": throttled_handler(8 << 20, stall_after=1 << 20),
+        "fast": throttled_handler(4 << 20),
+        "slow": throttled_handler(512 << 10),
+    }
+    servers = {name: start_server(dist, handler) for name, handler in handlers.items()}
+    urls = {name: f"http://127.0.0.1:{server.server_port}" for name, server in servers.items()}
+    bench = Bench(work, 20)
+    bench.env["MOLTBOT_NODE_MIRRORS"] = f"{urls['stalling']},{urls['fast']}"
+    bench.env["MOLTBOT_NODE_DIST_URL"] = urls["slow"]
+    try:
+        started = time.perf_counter()
+        output = bench.launch(bench.fresh_checkout(), "doctor")
+        elapsed = time.perf_counter() - started
+    finally:
+        for name, server in servers.items():
+            handlers[name].released.set()
+            server.shutdown()
+        bench.close()
+
+    used = re.findall(r"Downloading from (http://[\w.:]+)", output)
+    names = {url: name for name, url in urls.items()}
+    print(f"\n  Mirrors tried: {', '.join(names.get(url, url) for url in used)}")
+    print(f"  Cold launch: {elapsed:.1f}s (stall timeout {wrapper.MIRROR_STALL_TIMEOUT:.0f}s)")
+    if not used or names.get(used[-1]) != "fast":
+        print("  FAILED: expected to fail over from the stalling mirror to the fast one")
+        return 1
+    # One stall timeout, not one per download attempt on the stalled mirror
+    if elapsed > 1.5 * wrapper.MIRROR_STALL_TIMEOUT:
+        print("  FAILED: the stalled mirror was waited out more than once")
+        return 1
+    return 0
+
+def run_concurrent_launches(work: Path, processes: int = 8) -> int:
+    """Many cold launches of one checkout at once, then a killed lock holder."""
+    wrapper = Bench.load_wrapper(WRAPPER)
+    handler = throttled_handler(64 << 20)
+    bench = Bench(work, 20, handler)
+    archive = bench.dist / f"v{wrapper.NODE_VERSION}" / wrapper.NODE_ARCHIVE
+    deps_lock = wrapper.LOCKS_DIR.relative_to(wrapper.MOLTBOT_DIR) / "deps.lock"
+    failures = []
+    try:
+        root = bench.fresh_checkout()
+        started = time.perf_counter()
+        children = [subprocess.Popen(
+            [sys.executable, str(root / "moltbot_wrapper.py"), "doctor"],
+            cwd=root, env=bench.env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+            for _ in range(processes)]
+        outputs = [child.communicate()[0] for child in children]
+        codes = [child.returncode for child in children]
+        elapsed = time.perf_counter() - started
+        downloads = handler.sent / archive.stat().st_size
+        installs = len((root / ".bench-installs").read_text().splitlines())
+        print(f"\n  {processes} concurrent launches: {elapsed:.1f}s, exit codes {sorted(set(codes))}, "
+              f"{downloads:.1f} Node.js downloads, {installs} pnpm installs")
+        if any(codes):
+            failures.append("a concurrent launch failed:\n"
+                            + next(out for out, code in zip(outputs, codes) if code)[-2000:])
+        if round(downloads) != 1 or installs != 1:
+            failures.append("a setup phase ran more than once")
+
+        # Kill a wrapper (and its pnpm) while it holds the dependency lock
+        root = bench.fresh_checkout()
+        holder = subprocess.Popen(
+            [sys.executable, str(root / "moltbot_wrapper.py"), "doctor"],
+            cwd=root, env=dict(bench.env, BENCH_INSTALL_DELAY="60"), stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        deadline = time.monotonic() + 60
+        while not (root / deps_lock).exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        os.killpg(holder.pid, signal.SIGKILL)
+        holder.wait()
+        started = time.perf_counter()
+        output = bench.launch(root, "doctor")
+        elapsed = time.perf_counter() - started
+        broken = "Breaking stale deps lock" in output
+        print(f"  Launch after killing the lock holder: {elapsed:.1f}s, "
+              f"stale lock {'broken' if broken else 'NOT broken'}")
+        if not broken or elapsed > wrapper.LOCK_STALE_AFTER:
+            failures.append("the stale lock of a killed wrapper was not broken right away")
+    finally:
+        handler.released.set()
+        bench.close()
+
+    for failure in failures:
+        print(f"  FAILED: {failure}")
+    return 1 if failures else 0
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def echo_request(port: int, timeout: float = 2.0) -> str:
+    """One connection through the balancer; the answering worker's "worker N pid P"."""
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        sock.sendall(b"ping\n")
+        reply = sock.makefile("rb").readline().decode()
+    return reply.split(":", 1)[0] if reply.endswith("ping\n") else ""
+
+def run_balanced_echo_workers(work: Path, count: int = 3) -> int:
+    """Round-robin over echo workers behind the balancer, then kill one."""
+    root = work / "workers"
+    root.mkdir()
+    shutil.copy(WRAPPER, root / "moltbot_wrapper.py")
+    (root / "echo_worker.py").write_text(ECHO_WORKER.format(), encoding="utf-8")
+    proxy = free_port()
+    ports = [free_port() for _ in range(count)]
+    (root / "driver.py").write_text(BALANCER_DRIVER.format(ports=ports, proxy=proxy),
+                                    encoding="utf-8")
+    driver = subprocess.Popen([sys.executable, "driver.py"], cwd=root, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True, errors="replace")
+    failures = []
+
+    def requests(n: int) -> List[str]:
+        replies = []
+        for _ in range(n):
+            try:
+                replies.append(echo_request(proxy))
+            except OSError:
+                replies.append("")
+        return replies
+
+    def wait_for(check: Callable[[List[str]], bool], timeout: float = 15.0) -> List[str]:
+        deadline = time.monotonic() + timeout
+        replies = requests(count)
+        while not check(replies) and time.monotonic() < deadline:
+            time.sleep(0.2)
+            replies = requests(count)
+        return replies
+
+    def workers_of(replies: List[str]) -> set:
+        return {reply.split(" pid ")[0] for reply in replies if reply}
+
+    try:
+        everyone = {f"worker {i + 1}" for i in range(count)}
+        if workers_of(wait_for(lambda r: workers_of(r) == everyone)) != everyone:
+            failures.append("the workers never all answered through the balancer")
+        else:
+            replies = requests(2 * count)
+            spread = sorted(replies.count(reply) for reply in set(replies))
+            print(f"\n  Round-robin over {count} workers: {', '.join(replies)}")
+            if "" in replies or spread != [2] * count:
+                failures.append("round-robin did not spread connections evenly")
+
+            # Kill one worker: connections go to the others until it is back
+            victim = replies[0]
+            os.kill(int(victim.split(" pid ")[1]), signal.SIGKILL)
+            replies = requests(2 * count)
+            print(f"  After killing {victim}: {', '.join(r or 'FAILED' for r in replies)}")
+            if "" in replies or victim in replies:
+                failures.append("the killed worker was not taken out of the rotation")
+            name = victim.split(" pid ")[0]
+            replies = wait_for(lambda r: any(reply.startswith(name + " ") and reply != victim
+                                             for reply in r))
+            restarted = [reply for reply in replies if reply.startswith(name + " ")]
+            print(f"  Restarted: {', '.join(restarted) or 'no'}")
+            if not restarted:
+                failures.append("the killed worker was not restarted")
+    finally:
+        driver.send_signal(signal.SIGINT)
+        try:
+            output = driver.communicate(timeout=15)[0]
+        except subprocess.TimeoutExpired:
+            driver.kill()
+            output = driver.communicate()[0]
+    if driver.returncode != 0:
+        failures.append(f"the balancer exited with {driver.returncode}:\n{output[-2000:]}")
+
+    for failure in failures:
+        print(f"  FAILED: {failure}")
+    return 1 if failures else 0
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Benchmarks whose p50 got slower than baseline by more than threshold %."""
+    regressions = []
+    for name, stats in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        change = (stats["p50"] - old["p50"]) / old["p50"] * 100 if old["p50"] else 0.0
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"  {name:<24} {old['p50']:>10.1f} -> {stats['p50']:>10.1f} ms  {change:+6.1f}%  {marker}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark moltbot_wrapper.py with stub toolchains")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--cold-iterations", type=int, default=5)
+    parser.add_argument("--source-files", type=int, default=500,
+                        help="number of fake src/ files (drives input hashing cost)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="allowed p50 slowdown in percent before failing")
+    parser.add_argument("--keep", action="store_true", help="keep the temp directory")
+    parser.add_argument("--mirrors", action="store_true",
+                        help="only run the mirror ranking/failover scenario")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="only run the concurrent launch / stale lock scenario")
+    parser.add_argument("--workers", action="store_true",
+                        help="only run the gateway load balancer scenario")
+    opts = parser.parse_args()
+
+    if sys.platform == "win32":
+        print("The benchmark uses POSIX stub executables; run it on Linux.")
+        return 2
+
+    work = Path(tempfile.mkdtemp(prefix="moltbot-bench-"))
+    scenario = (run_mirror_failover if opts.mirrors
+                else run_concurrent_launches if opts.concurrent
+                else run_balanced_echo_workers if opts.workers else None)
+    if scenario:
+        try:
+            return scenario(work)
+        finally:
+            if opts.keep:
+                print(f"Kept {work}")
+            else:
+                shutil.rmtree(work, ignore_errors=True)
+
+    bench = Bench(work, opts.source_files)
+    try:
+        results = bench.run(opts.iterations, opts.cold_iterations)
+    finally:
+        bench.close()
+        if opts.keep:
+            print(f"Kept {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": opts.iterations,
+            "cold_iterations": opts.cold_iterations,
+            "source_files": opts.source_files,
+        },
+        "results": results,
+    }
+
+    print(f"\n  {'benchmark':<24} {'p50':>9} {'p90':>9} {'p99':>9} {'min':>9}   (ms)")
+    for name, stats in results.items():
+        print(f"  {name:<24} {stats['p50']:>9.1f} {stats['p90']:>9.1f} "
+              f"{stats['p99']:>9.1f} {stats['min']:>9.1f}")
+
+    with open(opts.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n  Results written to {opts.output}")
+
+    if opts.compare:
+        with open(opts.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n  Compared with {opts.compare} (threshold {opts.threshold:.0f}%):")
+        regressions = compare(report, baseline, opts.threshold)
+        if regressions:
+            print(f"\n  {len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())